@@ -1,63 +1,181 @@
+import hashlib
+import json
 import os
-import base64
-from typing import Any, Dict, Optional
+import tempfile
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional
 
 import certifi
 from dotenv import load_dotenv
 from pymongo import MongoClient
+from pymongo.collection import Collection
+from pymongo.errors import OperationFailure
 
 load_dotenv()
 
-# Standard placeholder used when a movie poster is missing or invalid.
-_PLACEHOLDER_SVG = (
-    '<svg xmlns="http://www.w3.org/2000/svg" width="220" height="330">'
-    '<rect width="100%" height="100%" fill="#e5e7eb"/>'
-    '<text x="50%" y="50%" dominant-baseline="middle" text-anchor="middle" '
-    'font-family="Arial" font-size="18" fill="#6b7280">No Poster</text>'
-    '</svg>'
-)
-PLACEHOLDER_POSTER = "data:image/svg+xml;base64," + base64.b64encode(_PLACEHOLDER_SVG.encode("utf-8")).decode("ascii")
-
 # -----------------------------
 # Mongo helpers (PyMongo)
 # -----------------------------
 
 _MONGO_CLIENT: Optional[MongoClient] = None
+_MONGO_CLIENT_LOCK = threading.Lock()
 
 
-def get_movies_collection():
-    """Return sample_mflix.movies collection (lazy singleton client)."""
-    global _MONGO_CLIENT
-    uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
-    db_name = os.getenv("MFLIX_DB", "sample_mflix")
-    coll_name = os.getenv("MFLIX_COLLECTION", "movies")
+def _mongodb_uri() -> str:
+    return os.getenv("MONGODB_URI", "mongodb://localhost:27017")
+
 
+def _get_mongo_client() -> MongoClient:
+    """Return the process-wide client, creating it on first use."""
+    global _MONGO_CLIENT
     if _MONGO_CLIENT is None:
-        # certifi helps when connecting to Atlas from environments missing CA bundle.
-        _MONGO_CLIENT = MongoClient(
-            uri,
-            tlsCAFile=certifi.where(),
-            serverSelectionTimeoutMS=5000,
-        )
-    return _MONGO_CLIENT[db_name][coll_name]
-
-
-def serialize_movie(doc: Dict[str, Any]) -> Dict[str, Any]:
-    """Make Mongo docs JSON-serializable and UI-friendly."""
-    imdb = doc.get("imdb") or {}
-    poster = doc.get('poster') or ""
-    # Use a standard placeholder if the poster is missing or empty.
-    if not poster:
-        poster = PLACEHOLDER_POSTER
-
-    return {
-        "id": str(doc.get("_id")),
-        "title": doc.get("title") or "Untitled",
-        "year": doc.get("year"),
-        "genres": doc.get("genres") or [],
-        "plot": doc.get("plot") or "",
-        "runtime": doc.get("runtime"),
-        "rated": doc.get("rated"),
-        "imdb_rating": imdb.get("rating"),
-        "poster": poster,
-    }
+        # Concurrent background loads may race to create the first client.
+        with _MONGO_CLIENT_LOCK:
+            if _MONGO_CLIENT is None:
+                # certifi helps when connecting to Atlas from environments missing CA bundle.
+                _MONGO_CLIENT = MongoClient(
+                    _mongodb_uri(),
+                    tlsCAFile=certifi.where(),
+                    serverSelectionTimeoutMS=5000,
+                    # Each page load fans out several queries at once, so keep
+                    # enough warm connections that they don't queue for one.
+                    maxPoolSize=50,
+                    minPoolSize=5,
+                    maxIdleTimeMS=60000,
+                    retryReads=True,
+                    # Plots and titles compress well; the server picks the first
+                    # compressor it supports (zstd/snappy need the pymongo extras).
+                    compressors="zstd,snappy,zlib",
+                    zlibCompressionLevel=3,
+                )
+    return _MONGO_CLIENT
+
+
+@lru_cache(maxsize=None)
+def _get_collection(db_name: str, coll_name: str) -> Collection:
+    coll = _get_mongo_client()[db_name][coll_name]
+    ensure_indexes(coll)
+    return coll
+
+
+def get_movies_collection() -> Collection:
+    """Return sample_mflix.movies collection (lazy singleton client)."""
+    return _get_collection(
+        os.getenv("MFLIX_DB", "sample_mflix"),
+        os.getenv("MFLIX_COLLECTION", "movies"),
+    )
+
+
+def ensure_indexes(coll: Collection) -> None:
+    """Create the indexes the app's queries rely on, if they are missing."""
+    try:
+        # Title sort and (title, _id) range pagination.
+        coll.create_index([("title", 1), ("_id", 1)])
+        # Genre equality then the title sort, so genre pages come back in
+        # index order; the genres prefix also serves distinct("genres").
+        coll.create_index([("genres", 1), ("title", 1)])
+        # Year range filters.
+        coll.create_index([("year", 1), ("title", 1)])
+        # A collection can only have one text index, so reuse any existing one.
+        if not has_text_index(coll):
+            coll.create_index([("title", "text"), ("plot", "text")])
+            has_text_index.cache_clear()
+    except OperationFailure:
+        # Read-only users cannot create indexes; queries still work (text
+        # searches fall back to $regex), just without these plans.
+        pass
+
+
+@lru_cache(maxsize=None)
+def has_text_index(coll: Collection) -> bool:
+    """Whether the collection has a text index, which `$text` queries require."""
+    return any(
+        field == "_fts"
+        for spec in coll.index_information().values()
+        for field, _ in spec["key"]
+    )
+
+
+PLOT_PREVIEW_LENGTH = 240
+
+# Shapes movies for the UI on the server, so pages need no reshaping in Python.
+# `_id` and `_sort_title` are the raw sort keys, kept for range pagination
+# bookmarks; display fields get their defaults applied.
+MOVIE_PROJECTION: Dict[str, Any] = {
+    "_id": 1,
+    "_sort_title": "$title",
+    "id": {"$toString": "$_id"},
+    "title": {"$ifNull": ["$title", "Untitled"]},
+    "year": {"$ifNull": ["$year", None]},
+    "genres": {"$ifNull": ["$genres", []]},
+    # Cards only show the first few lines of the plot, so don't ship the rest.
+    "plot": {"$substrCP": [{"$ifNull": ["$plot", ""]}, 0, PLOT_PREVIEW_LENGTH]},
+    "runtime": {"$ifNull": ["$runtime", None]},
+    "rated": {"$ifNull": ["$rated", None]},
+    "imdb_rating": {"$ifNull": ["$imdb.rating", None]},
+    # Missing or empty posters become null; the card shows a static placeholder.
+    "poster": {"$cond": [{"$gt": ["$poster", ""]}, "$poster", None]},
+}
+
+
+def movie_page_pipeline(
+    criteria: Dict[str, Any],
+    sort: Dict[str, Any],
+    skip: int,
+    limit: int,
+) -> List[Dict[str, Any]]:
+    """Aggregation pipeline returning one sorted page of UI-ready movies."""
+    stages: List[Dict[str, Any]] = [{"$match": criteria}, {"$sort": sort}]
+    if skip:
+        stages.append({"$skip": skip})
+    stages.append({"$limit": limit})
+    stages.append({"$project": MOVIE_PROJECTION})
+    return stages
+
+
+def fetch_movie_page(
+    coll: Collection,
+    criteria: Dict[str, Any],
+    sort: Dict[str, Any],
+    skip: int,
+    limit: int,
+) -> List[Dict[str, Any]]:
+    """Run movie_page_pipeline and return the page."""
+    # A batch the size of the page returns it in a single round-trip with no
+    # follow-up getMore.
+    return list(coll.aggregate(movie_page_pipeline(criteria, sort, skip, limit), batchSize=limit))
+
+
+_GENRES_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+
+def get_genres(coll: Collection) -> List[str]:
+    """Return the sorted distinct genres, cached on disk for a day."""
+    # Key the cache by deployment, collection and (cheap, metadata-only)
+    # document count, so another cluster or a reloaded dataset misses it.
+    digest = hashlib.sha1(
+        f"{_mongodb_uri()}|{coll.full_name}|{coll.estimated_document_count()}".encode("utf-8")
+    ).hexdigest()[:16]
+    path = Path(tempfile.gettempdir()) / f"mflix_genres_{digest}.json"
+    try:
+        if time.time() - path.stat().st_mtime < _GENRES_CACHE_TTL_SECONDS:
+            return json.loads(path.read_text())
+    except (OSError, ValueError):
+        pass
+
+    genres = sorted(g for g in coll.distinct("genres") if isinstance(g, str))
+    try:
+        path.write_text(json.dumps(genres))
+    except OSError:
+        pass
+    return genres
+
+
+@lru_cache(maxsize=256)
+def count_movies(criteria_json: str) -> int:
+    """Count movies matching the JSON-encoded criteria (cached until cleared)."""
+    return get_movies_collection().count_documents(json.loads(criteria_json))
+
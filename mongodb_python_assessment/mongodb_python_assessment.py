@@ -1,8 +1,46 @@
 from typing import Any, Dict
 
+import orjson
 import reflex as rx
+from reflex.utils import format as rx_format
+from reflex.utils import serializers
+
 from .state import MovieState
 
+# State deltas (e.g. a page of movies) are JSON-encoded on every update; orjson
+# does that several times faster than the stdlib encoder Reflex uses.
+_stdlib_json_dumps = rx_format.json_dumps
+
+
+def _orjson_default(value: Any) -> Any:
+    serialized = serializers.serialize(value)
+    return str(value) if serialized is None else serialized
+
+
+def _orjson_compatible(kwargs: Dict[str, Any]) -> bool:
+    """Whether orjson's output already satisfies these json.dumps options."""
+    for key, value in kwargs.items():
+        # orjson output is always compact and never escapes non-ASCII.
+        # python-socketio encodes every WebSocket packet (and so every state
+        # delta) with separators=(",", ":").
+        if key == "separators" and tuple(value) == (",", ":"):
+            continue
+        if key == "ensure_ascii" and not value:
+            continue
+        return False
+    return True
+
+
+def _orjson_dumps(obj: Any, **kwargs: Any) -> str:
+    # Callers asking for other json.dumps options keep the stdlib encoder.
+    if not _orjson_compatible(kwargs):
+        return _stdlib_json_dumps(obj, **kwargs)
+    return orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+rx_format.json_dumps = _orjson_dumps
+
+
 def toolbar() -> rx.Component:
     return rx.card(
         rx.vstack(
@@ -18,9 +56,10 @@ def toolbar() -> rx.Component:
                     rx.vstack(
                             rx.text("Search", size="1", color_scheme="gray"),
                             rx.input(
-                                placeholder="Search title or plot…",
+                                placeholder="Search whole words or a phrase…",
                                 value=MovieState.q,
                                 on_change=MovieState.set_query,
+                                debounce_timeout=250,
                                 width=["100%", "340px"],
                             ),
                             width=["100%", "340px"],
@@ -98,7 +137,7 @@ def movie_card(movie: rx.Var[Dict[str, Any]]) -> rx.Component:
     return rx.card(
         rx.vstack(
             rx.image(
-                src=movie["poster"],
+                src=rx.cond(movie["poster"], movie["poster"], "/no-poster.svg"),
                 width="100%",
                 height="260px",
                 object_fit="cover",
@@ -1,22 +1,52 @@
+import asyncio
+import json
 import math
 import re
-from typing import Any, Dict, List, Optional
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
 
 import reflex as rx
 
-from .helpers import get_movies_collection, serialize_movie
+from .helpers import (
+    count_movies,
+    fetch_movie_page,
+    get_genres,
+    get_movies_collection,
+    has_text_index,
+)
+
+# Searches made up only of words can be answered by the text index.
+_Q_SAFE = re.compile(r"^[\w\s]+$", re.ASCII)
+
+
+@lru_cache(maxsize=256)
+def _escape_query(q: str) -> str:
+    return re.escape(q)
 
 
 class MovieState(rx.State):
     # UI state
     page_size: str = "25"
+    page_size_int: int = 25
     page: int = 0
 
+    # Range pagination bookmarks: (title, _id) of the first/last movie on the
+    # page that was last loaded, and which page that was.
+    _first_key: Optional[Tuple[Any, Any]] = None
+    _last_key: Optional[Tuple[Any, Any]] = None
+    _key_page: int = -1
+
+    # Incremented by every load; a load that finishes after a newer one started
+    # is stale and drops its results.
+    _load_generation: int = 0
+
     # Filters
     q: str = ""
     genre: str = "All"
     min_year: str = ""
+    min_year_int: Optional[int] = None
     max_year: str = ""
+    max_year_int: Optional[int] = None
 
     # Data
     total: int = 0
@@ -33,13 +63,9 @@ class MovieState(rx.State):
 
     @rx.var
     def total_pages(self) -> int:
-        try:
-            page_size_int = int(self.page_size)
-        except Exception:
-            page_size_int = 25
-        if page_size_int <= 0:
+        if self.page_size_int <= 0:
             return 1
-        return max(1, math.ceil(self.total / page_size_int))
+        return max(1, math.ceil(self.total / self.page_size_int))
 
     @rx.var
     def has_prev(self) -> bool:
@@ -47,11 +73,7 @@ class MovieState(rx.State):
 
     @rx.var
     def has_next(self) -> bool:
-        try:
-            page_size_int = int(self.page_size)
-        except Exception:
-            page_size_int = 25
-        return (self.page + 1) * page_size_int < self.total
+        return (self.page + 1) * self.page_size_int < self.total
 
     @rx.var
     def page_label(self) -> str:
@@ -61,11 +83,40 @@ class MovieState(rx.State):
     # Query builder
     # -----------------------------
 
-    def _criteria(self) -> Dict[str, Any]:
+    def _uses_text_search(self, text_index: bool) -> bool:
+        """Whether q can be answered by the collection's text index."""
+        q = self.q.strip()
+        return text_index and bool(q) and bool(_Q_SAFE.match(q))
+
+    # Backend-only computed var: rebuilt only when one of the filters changes.
+    @rx.var(deps=["genre", "min_year_int", "max_year_int"], auto_deps=False)
+    def _filter_terms(self) -> List[Dict[str, Any]]:
+        and_terms: List[Dict[str, Any]] = []
+
+        if self.genre and self.genre != "All":
+            and_terms.append({"genres": self.genre})
+
+        year_filter: Dict[str, Any] = {}
+        if self.min_year_int is not None:
+            year_filter["$gte"] = self.min_year_int
+        if self.max_year_int is not None:
+            year_filter["$lte"] = self.max_year_int
+        if year_filter:
+            and_terms.append({"year": year_filter})
+
+        return and_terms
+
+    def _criteria(self, text_search: bool) -> Dict[str, Any]:
         and_terms: List[Dict[str, Any]] = []
 
-        if self.q.strip():
-            safe = re.escape(self.q.strip())
+        q = self.q.strip()
+        if text_search:
+            # A quoted phrase keeps every word required, like the regex search.
+            # Phrases match the field text literally, so collapse runs of
+            # whitespace to the single spaces used in titles and plots.
+            and_terms.append({"$text": {"$search": '"%s"' % " ".join(q.split())}})
+        elif q:
+            safe = _escape_query(q)
             and_terms.append(
                 {
                     "$or": [
@@ -75,47 +126,84 @@ class MovieState(rx.State):
                 }
             )
 
-        if self.genre and self.genre != "All":
-            and_terms.append({"genres": self.genre})
-
-        year_filter: Dict[str, Any] = {}
-        if self.min_year.strip().isdigit():
-            year_filter["$gte"] = int(self.min_year.strip())
-        if self.max_year.strip().isdigit():
-            year_filter["$lte"] = int(self.max_year.strip())
-        if year_filter:
-            and_terms.append({"year": year_filter})
-
+        and_terms.extend(self._filter_terms)
         return {"$and": and_terms} if and_terms else {}
 
+    def _range_criteria(self, page: int) -> Optional[Dict[str, Any]]:
+        """Bookmark predicate for loading `page`, if it is next to the bookmarks."""
+        # The first page is a plain skip of 0, which costs nothing.
+        if page == 0:
+            return None
+        if page == self._key_page + 1:
+            key, op = self._last_key, "$gt"
+        elif page == self._key_page - 1:
+            key, op = self._first_key, "$lt"
+        else:
+            return None
+        # Range queries only seek correctly within the string type bracket.
+        if key is None or not isinstance(key[0], str):
+            return None
+        title, movie_id = key
+        branches: List[Dict[str, Any]] = [
+            {"title": {op: title}},
+            {"title": title, "_id": {op: movie_id}},
+        ]
+        if op == "$lt":
+            # Null, missing and numeric titles sort before every string, but
+            # a string comparison never matches them.
+            branches.append({"title": None})
+            branches.append({"title": {"$type": "number"}})
+        return {"$or": branches}
+
+    def _clear_bookmarks(self):
+        self._first_key = None
+        self._last_key = None
+        self._key_page = -1
+
+    def _reset_paging(self):
+        self.page = 0
+        self._clear_bookmarks()
+
     # -----------------------------
     # Events: filter + paging controls
     # -----------------------------
 
     def set_query(self, value: str):
         self.q = value
+        return MovieState.apply_filters
+
+    # Bookmarks only describe the result set they were read from, so filter
+    # changes drop them and the next page change falls back to skip.
 
     def set_genre(self, value: str):
         self.genre = value
+        self._clear_bookmarks()
 
     def set_min_year(self, value: str):
         self.min_year = value
+        self.min_year_int = int(value.strip()) if value.strip().isdigit() else None
+        self._clear_bookmarks()
 
     def set_max_year(self, value: str):
         self.max_year = value
+        self.max_year_int = int(value.strip()) if value.strip().isdigit() else None
+        self._clear_bookmarks()
 
     def change_page_size(self, value: str):
         try:
-            self.page_size = str(int(value))
+            self.page_size_int = int(value)
         except Exception:
-            self.page_size = "25"
-        self.page = 0
+            self.page_size_int = 25
+        self.page_size = str(self.page_size_int)
+        self._reset_paging()
+        count_movies.cache_clear()
         self.movies = []
         self.error = ""
         return MovieState.load_movies
 
     def apply_filters(self):
-        self.page = 0
+        self._reset_paging()
+        count_movies.cache_clear()
         self.movies = []
         self.error = ""
         return MovieState.load_movies
@@ -138,52 +226,104 @@ class MovieState(rx.State):
     # Data loaders (background)
     # -----------------------------
 
+    def _fetch_page(
+        self,
+        coll: Any,
+        criteria: Dict[str, Any],
+        text_search: bool,
+        range_criteria: Optional[Dict[str, Any]],
+        backwards: bool,
+        page: int,
+        page_size_int: int,
+    ) -> List[Dict[str, Any]]:
+        # Text searches are ranked by relevance, so they page with skip.
+        # Otherwise adjacent pages seek from the (title, _id) bookmark,
+        # backed by the {title: 1, _id: 1} index, and anything else falls
+        # back to skip.
+        if text_search:
+            return fetch_movie_page(
+                coll,
+                criteria,
+                {"score": {"$meta": "textScore"}, "title": 1, "_id": 1},
+                page * page_size_int,
+                page_size_int,
+            )
+
+        order = -1 if backwards else 1
+        sort = {"title": order, "_id": order}
+        if range_criteria is not None:
+            criteria = {"$and": [criteria, range_criteria]}
+            skip = 0
+        else:
+            skip = page * page_size_int
+
+        docs = fetch_movie_page(coll, criteria, sort, skip, page_size_int)
+        if backwards:
+            docs.reverse()
+        return docs
+
     @rx.event(background=True)
     async def load_movies(self):
+        generation = None
         try:
-            coll = get_movies_collection()
-            criteria = self._criteria()
-            projection = {
-                "title": 1,
-                "year": 1,
-                "genres": 1,
-                "plot": 1,
-                "runtime": 1,
-                "rated": 1,
-                "imdb.rating": 1,
-                "poster": 1,
-            }
-
-            if len(self.genres) <= 1:
-                distinct_genres = sorted([g for g in coll.distinct("genres") if isinstance(g, str)])
-                async with self:
-                    self.genres = ["All"] + distinct_genres
+            # Connecting (and the one-off index checks) is blocking I/O, so
+            # keep it off the event loop.
+            coll = await asyncio.to_thread(get_movies_collection)
+            text_index = await asyncio.to_thread(has_text_index, coll)
 
             async with self:
+                self._load_generation += 1
+                generation = self._load_generation
+                # Decided once, so the criteria and the sort always agree.
+                text_search = self._uses_text_search(text_index)
+                criteria = self._criteria(text_search)
+                page = self.page
+                page_size_int = self.page_size_int
+                range_criteria = self._range_criteria(page)
+                backwards = range_criteria is not None and page < self._key_page
                 self.loading = True
                 self.error = ""
 
-            total = coll.count_documents(criteria)
-            try:
-                page_size_int = int(self.page_size)
-            except Exception:
-                page_size_int = 25
-            skip = self.page * page_size_int
-
-            docs = list(
-                coll.find(criteria, projection)
-                .sort("title", 1)
-                .skip(skip)
-                .limit(page_size_int)
-            )
-            serialized = [serialize_movie(d) for d in docs]
+            # The count, page and (first load only) genre queries are
+            # independent round-trips, so run them concurrently. Paging doesn't
+            # change the total, so counts are cached per criteria.
+            queries = [
+                asyncio.to_thread(count_movies, json.dumps(criteria, sort_keys=True, default=str)),
+                asyncio.to_thread(
+                    self._fetch_page,
+                    coll,
+                    criteria,
+                    text_search,
+                    range_criteria,
+                    backwards,
+                    page,
+                    page_size_int,
+                ),
+            ]
+            if len(self.genres) <= 1:
+                queries.append(asyncio.to_thread(get_genres, coll))
+            total, docs, *genres = await asyncio.gather(*queries)
+            # The raw sort keys only feed the bookmarks, not the UI.
+            keys = [(doc.pop("_sort_title", None), doc.pop("_id")) for doc in docs]
 
             async with self:
+                if genres:
+                    self.genres = ["All"] + genres[0]
+                # A newer load (page change or new search) owns the results
+                # and the bookmarks.
+                if self._load_generation != generation:
+                    return
                 self.total = total
-                self.movies = serialized[: page_size_int]
+                self.movies = docs[: page_size_int]
+                if keys:
+                    self._first_key = keys[0]
+                    self._last_key = keys[-1]
+                    self._key_page = page
                 self.loading = False
 
         except Exception as e:
             async with self:
+                if generation is not None and self._load_generation != generation:
+                    return
                 self.loading = False
                 self.error = f"{type(e).__name__}: {e}"